@@ -2,8 +2,15 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import io
+import re
+import hashlib
+import zipfile
+import xlsxwriter
+import time
+import warnings
 from datetime import datetime
-from openpyxl import load_workbook
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Page configuration
 st.set_page_config(
@@ -47,95 +54,170 @@ ADDRESS_COLUMNS = {
     'zip': 'Postal Code'
 }
 
+# Text columns with few distinct values, loaded as categoricals
+CATEGORICAL_COLUMNS = ['Cooling', 'CITYNAME', 'City', 'State or Province']
+
+# Extra columns carried into the reports and city statistics
+REPORT_COLUMNS = ['Listing #', 'Closed Date', 'SALEKEY', 'NOPAR', 'ADDITIONAL_PARCELS', 'CITYNAME',
+                  *ADDRESS_COLUMNS.values()]
+
 ZILLOW_URL_BASE = "https://www.zillow.com/homes/"
 
-# --- Helper Functions ---
+# Report columns that link to the URL stored in another column
+HYPERLINK_COLUMNS = {'Parcel_ID': 'Parcel_URL', 'Address': 'Zillow_URL'}
 
-def format_zillow_url(address, city, state, zip_code):
-    """Create a Zillow search URL from address components."""
-    if pd.isna(address) or pd.isna(city) or pd.isna(zip_code):
-        return None
-    
-    import re
-    
-    address_clean = str(address).strip()
-    city_clean = str(city).strip()
-    zip_clean = str(zip_code).strip().split('-')[0]
-    
-    address_clean = re.sub(r'\s+(Apt|Unit|#|Suite)\s*[\w-]*$', '', address_clean, flags=re.IGNORECASE)
-    address_formatted = re.sub(r'[^\w\s-]', '', address_clean)
-    address_formatted = re.sub(r'\s+', '-', address_formatted)
-    
-    city_formatted = re.sub(r'[^\w\s-]', '', city_clean)
-    city_formatted = re.sub(r'\s+', '-', city_formatted)
-    
-    url_slug = f"{address_formatted}-{city_formatted}-OH-{zip_clean}_rb"
-    return f"{ZILLOW_URL_BASE}{url_slug}/"
-
-def values_equal(val1, val2):
-    """Check if two values are equal within tolerance."""
-    try:
-        num1 = pd.to_numeric(val1, errors='raise')
-        num2 = pd.to_numeric(val2, errors='raise')
-
-        if pd.isna(num1) and pd.isna(num2):
-            return True
-        elif pd.isna(num1) != pd.isna(num2):
-            return False
-        else:
-            return np.isclose(num1, num2, equal_nan=False, rtol=1e-9, atol=NUMERIC_TOLERANCE)
-    except (ValueError, TypeError):
-        str1 = str(val1).strip().lower() if pd.notna(val1) else ''
-        str2 = str(val2).strip().lower() if pd.notna(val2) else ''
-        return str1 == str2
-
-def categorical_match(mls_val, cama_val, mapping):
-    """Check if categorical MLS field matches expected CAMA value."""
-    check_text = mapping.get('mls_check_contains', '')
-    expected_if_true = mapping.get('cama_expected_if_true')
-    expected_if_false = mapping.get('cama_expected_if_false')
-    case_sensitive = mapping.get('case_sensitive', False)
-
-    mls_str = str(mls_val).strip() if pd.notna(mls_val) else ''
-
-    if not case_sensitive:
-        mls_str = mls_str.lower()
-        check_text = check_text.lower()
-
-    text_found = check_text in mls_str
-    expected_cama = expected_if_true if text_found else expected_if_false
-
-    try:
-        cama_numeric = pd.to_numeric(cama_val, errors='coerce')
-        expected_numeric = pd.to_numeric(expected_cama, errors='coerce')
-
-        if pd.isna(cama_numeric) and pd.isna(expected_numeric):
-            return True
-        elif pd.isna(cama_numeric) or pd.isna(expected_numeric):
-            return False
-        else:
-            return np.isclose(cama_numeric, expected_numeric, equal_nan=False, rtol=1e-9, atol=NUMERIC_TOLERANCE)
-    except:
-        return str(cama_val).strip().lower() == str(expected_cama).strip().lower()
+# Download file name prefix for each report, keyed by its sheet name
+REPORT_FILE_PREFIXES = {
+    'Missing in CAMA': 'missing_in_CAMA',
+    'Missing in MLS': 'missing_in_MLS',
+    'Value Mismatches': 'value_mismatches',
+    'Perfect Matches': 'perfect_matches',
+}
+
+# Excel allows at most this many hyperlinks per worksheet; later links are written as plain text
+EXCEL_MAX_HYPERLINKS = 65530
 
-def calculate_difference(val1, val2):
-    """Calculate the difference between two values."""
-    try:
-        num1 = pd.to_numeric(val1, errors='raise')
-        num2 = pd.to_numeric(val2, errors='raise')
+# Maximum rows shown in each on-screen preview table
+PREVIEW_ROWS = 1000
 
-        if pd.isna(num1) or pd.isna(num2):
-            return "N/A"
+APT_RE = re.compile(r'\s+(Apt|Unit|#|Suite)\s*[\w-]*$', re.IGNORECASE)
+NONWORD_RE = re.compile(r'[^\w\s-]')
+WHITESPACE_RE = re.compile(r'\s+')
+ZIP_SUFFIX_RE = re.compile(r'-.*$')
 
-        diff = num1 - num2
-        return f"{diff:,.2f}"
-    except (ValueError, TypeError):
-        return "Text difference"
+# --- Helper Functions ---
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4)
+def load_excel(file_bytes, usecols=None, dtype=None):
+    """Load an uploaded Excel file, cached on the file contents.
+
+    Only columns in usecols are read; columns missing from the file are ignored.
+    Text-only columns are stored as Arrow-backed strings.
+    """
+    df = pd.read_excel(
+        io.BytesIO(file_bytes),
+        usecols=(lambda col: col in usecols) if usecols else None,
+        dtype=dtype
+    )
+
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            df[col] = df[col].astype('string[pyarrow]')
+
+    return df
+
+def referenced_columns(unique_id_col, cols_to_compare_mapping, cols_to_compare_sum=None,
+                       cols_to_compare_categorical=None):
+    """Return the sets of MLS and CAMA columns used by the comparison and reports."""
+    mls_cols = {unique_id_col.get('mls_col'), *REPORT_COLUMNS}
+    cama_cols = {unique_id_col.get('cama_col'), *REPORT_COLUMNS}
+
+    for mapping in cols_to_compare_mapping + (cols_to_compare_categorical or []):
+        mls_cols.add(mapping['mls_col'])
+        cama_cols.add(mapping['cama_col'])
+
+    for mapping in cols_to_compare_sum or []:
+        mls_cols.add(mapping['mls_col'])
+        cama_cols.update(mapping['cama_cols'])
+
+    return mls_cols, cama_cols
+
+def build_zillow_urls(rows):
+    """Create Zillow search URLs from the address components of each row."""
+    address_col = ADDRESS_COLUMNS.get('address', 'Address')
+    city_col = ADDRESS_COLUMNS.get('city', 'City')
+    zip_col = ADDRESS_COLUMNS.get('zip', 'Postal Code')
+
+    components = rows.reindex(columns=[address_col, city_col, zip_col], fill_value='')
+    has_components = components.notna().all(axis=1)
+
+    address_formatted = (components[address_col].astype(str).str.strip()
+                         .str.replace(APT_RE, '', regex=True)
+                         .str.replace(NONWORD_RE, '', regex=True)
+                         .str.replace(WHITESPACE_RE, '-', regex=True))
+    city_formatted = (components[city_col].astype(str).str.strip()
+                      .str.replace(NONWORD_RE, '', regex=True)
+                      .str.replace(WHITESPACE_RE, '-', regex=True))
+    zip_clean = components[zip_col].astype(str).str.strip().str.replace(ZIP_SUFFIX_RE, '', regex=True)
+
+    urls = ZILLOW_URL_BASE + address_formatted + '-' + city_formatted + '-OH-' + zip_clean + '_rb/'
+    return urls.astype(object).where(has_components, None)
+
+def build_parcel_urls(record_ids, parcel_url_template):
+    """Fill the {parcel_id} placeholders of the parcel URL template for each record ID."""
+    ids = record_ids.astype(str)
+    parts = parcel_url_template.split('{parcel_id}')
+    urls = parts[0]
+    for part in parts[1:]:
+        urls = urls + ids + part
+    return urls
+
+def normalize_text(values):
+    """Strip and lowercase values for case-insensitive text comparison."""
+    return values.astype(str).str.strip().str.lower()
+
+def contains_text(values, text, case_sensitive=False):
+    """Flag values containing text; categoricals are only searched once per category."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        found = values.cat.categories.astype(str).str.contains(text, case=case_sensitive, regex=False)
+        # Code -1 (missing) picks the trailing False
+        return pd.Series(np.append(found, False)[values.cat.codes], index=values.index)
+    return values.astype(str).str.contains(text, case=case_sensitive, regex=False, na=False)
+
+def is_blank(values):
+    """Flag values that are missing or whitespace-only strings."""
+    return (values.isna() | values.astype('string').str.strip().eq('')).astype(bool)
+
+def format_difference(mls_numeric, cama_numeric):
+    """Format the differences between two numeric Series."""
+    diff = mls_numeric - cama_numeric
+    return diff.map('{:,.2f}'.format).where(diff.notna(), "Text difference")
+
+def build_parcel_links(merged_df, cama_id_col_name, parcel_url_template):
+    """Build the iasWorld and Zillow URLs once per parcel, indexed by parcel ID."""
+    parcels = merged_df.drop_duplicates(cama_id_col_name)
+    record_ids = parcels[cama_id_col_name]
+
+    return pd.DataFrame({
+        'Parcel_URL': build_parcel_urls(record_ids, parcel_url_template) if parcel_url_template else '',
+        'Zillow_URL': build_zillow_urls(parcels)
+    }).set_index(record_ids)
+
+def build_records(rows, cama_id_col_name, parcel_links, fields):
+    """Build report records for the given merged rows, with links and address details."""
+    address = rows.get(ADDRESS_COLUMNS.get('address', 'Address'), '')
+    city = rows.get(ADDRESS_COLUMNS.get('city', 'City'), '')
+    state = rows.get(ADDRESS_COLUMNS.get('state', 'State or Province'), '')
+    zip_code = rows.get(ADDRESS_COLUMNS.get('zip', 'Postal Code'), '')
+
+    record_ids = rows[cama_id_col_name]
+    links = parcel_links.reindex(record_ids)
+
+    return pd.DataFrame({
+        'Parcel_ID': record_ids,
+        'NOPAR': rows.get('NOPAR', ''),
+        'ADDITIONAL_PARCELS': rows.get('ADDITIONAL_PARCELS', ''),
+        'Listing_Number': rows.get('Listing #', ''),
+        'SALEKEY': rows.get('SALEKEY', ''),
+        'Address': address,
+        'City': city,
+        'State': state,
+        'Zip': zip_code,
+        **fields,
+        'Parcel_URL': links['Parcel_URL'].to_numpy(),
+        'Zillow_URL': links['Zillow_URL'].to_numpy()
+    }, index=rows.index)
 
 def compare_data_enhanced(df_mls, df_cama, unique_id_col, cols_to_compare_mapping,
                          cols_to_compare_sum=None, cols_to_compare_categorical=None, 
-                         window_id=None):
-    """Compare MLS and CAMA dataframes and return discrepancies."""
+                         window_id=None, progress_callback=None):
+    """Compare MLS and CAMA dataframes and return discrepancies.
+
+    progress_callback, if given, is called with (fraction_done, message) as each stage finishes.
+    """
+    def report_progress(fraction_done, message):
+        if progress_callback:
+            progress_callback(fraction_done, message)
     
     if df_mls is None or df_cama is None:
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
@@ -151,17 +233,27 @@ def compare_data_enhanced(df_mls, df_cama, unique_id_col, cols_to_compare_mappin
         st.error(f"Column '{cama_id_col_name}' not found in CAMA data")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    # Rename and merge
-    df_mls_renamed = df_mls.copy()
+    # Keep only the columns the comparison and reports use, then rename and merge
+    mls_cols, cama_cols = referenced_columns(unique_id_col, cols_to_compare_mapping,
+                                             cols_to_compare_sum, cols_to_compare_categorical)
+    df_mls_renamed = df_mls[[col for col in df_mls.columns if col in mls_cols]]
     df_mls_renamed = df_mls_renamed.rename(columns={mls_id_col_name: cama_id_col_name})
-    
-    matched_df = pd.merge(df_mls_renamed, df_cama, on=cama_id_col_name, how='inner')
-    merged_df = pd.merge(df_mls_renamed, df_cama, on=cama_id_col_name, how='outer', indicator=True)
+    df_cama = df_cama[[col for col in df_cama.columns if col in cama_cols]]
+    
+    # Bucket parcels by ID alone; one membership test per side gives both the
+    # matched rows and the missing rows, and only matched rows are merged
+    mls_id_values = df_mls_renamed[cama_id_col_name]
+    cama_id_values = df_cama[cama_id_col_name]
+    mls_in_cama = mls_id_values.isin(pd.Index(cama_id_values.dropna().unique()))
+    cama_in_mls = cama_id_values.isin(pd.Index(mls_id_values.dropna().unique()))
+
+    merged_df = pd.merge(
+        df_mls_renamed[mls_in_cama],
+        df_cama[cama_in_mls],
+        on=cama_id_col_name, how='inner'
+    )
 
-    missing_in_cama = []
-    missing_in_mls = []
-    value_mismatches = []
-    perfect_matches = []
+    report_progress(0.2, f"Matched {len(merged_df):,} records")
 
     # Build parcel URL template if window_id provided
     if window_id:
@@ -169,311 +261,325 @@ def compare_data_enhanced(df_mls, df_cama, unique_id_col, cols_to_compare_mappin
     else:
         parcel_url_template = None
 
-    for index, row in merged_df.iterrows():
-        record_id = row.get(cama_id_col_name)
-        merge_status = row.get('_merge')
-
-        if merge_status == 'left_only':
-            listing_num = row.get('Listing #', '')
-            closed_date = row.get('Closed Date', '')
-            missing_in_cama.append({
-                'Parcel_ID': record_id,
-                'Listing_Number': listing_num,
-                'Closed_Date': closed_date
-            })
-
-        elif merge_status == 'right_only':
-            missing_in_mls.append({'Parcel_ID': record_id})
-
-        elif merge_status == 'both':
-            listing_num = row.get('Listing #', '')
-            salekey = row.get('SALEKEY', '')
-            nopar = row.get('NOPAR', '')
-            additional_parcels = row.get('ADDITIONAL_PARCELS', '')
-            
-            address = row.get(ADDRESS_COLUMNS.get('address', 'Address'), '')
-            city = row.get(ADDRESS_COLUMNS.get('city', 'City'), '')
-            state = row.get(ADDRESS_COLUMNS.get('state', 'State or Province'), '')
-            zip_code = row.get(ADDRESS_COLUMNS.get('zip', 'Postal Code'), '')
-            
-            record_mismatches = []
-            fields_compared = []
-
-            # Standard comparisons
-            for mapping in cols_to_compare_mapping:
-                mls_col = mapping['mls_col']
-                cama_col = mapping['cama_col']
-
-                if mls_col not in merged_df.columns or cama_col not in merged_df.columns:
-                    continue
-
-                mls_val = row.get(mls_col)
-                cama_val = row.get(cama_col)
-
-                mls_is_blank = pd.isna(mls_val) or (isinstance(mls_val, str) and mls_val.strip() == '')
-                cama_is_blank = pd.isna(cama_val) or (isinstance(cama_val, str) and cama_val.strip() == '')
-
-                if mls_is_blank or cama_is_blank:
-                    continue
-
-                fields_compared.append(mls_col)
-
-                if SKIP_ZERO_VALUES:
-                    try:
-                        mls_numeric = pd.to_numeric(mls_val, errors='coerce')
-                        cama_numeric = pd.to_numeric(cama_val, errors='coerce')
-                        # Only skip if BOTH values are zero (both agree there's nothing)
-                        # If one is zero and the other is not, that's a mismatch!
-                        if (pd.notna(mls_numeric) and mls_numeric == 0) and (pd.notna(cama_numeric) and cama_numeric == 0):
-                            continue
-                    except:
-                        pass
-
-                if not values_equal(mls_val, cama_val):
-                    record_mismatches.append({
-                        'Parcel_ID': record_id,
-                        'NOPAR': nopar,
-                        'ADDITIONAL_PARCELS': additional_parcels,
-                        'Listing_Number': listing_num,
-                        'SALEKEY': salekey,
-                        'Address': address,
-                        'City': city,
-                        'State': state,
-                        'Zip': zip_code,
-                        'Field_MLS': mls_col,
-                        'Field_CAMA': cama_col,
-                        'MLS_Value': mls_val,
-                        'CAMA_Value': cama_val,
-                        'Difference': calculate_difference(mls_val, cama_val),
-                        'Parcel_URL': parcel_url_template.format(parcel_id=record_id) if parcel_url_template else '',
-                        'Zillow_URL': format_zillow_url(address, city, state, zip_code)
-                    })
-
-            # Sum comparisons
-            if cols_to_compare_sum:
-                for mapping in cols_to_compare_sum:
-                    mls_col = mapping['mls_col']
-                    cama_cols = mapping['cama_cols']
-
-                    if mls_col not in merged_df.columns:
-                        continue
-                    
-                    missing_cols = [col for col in cama_cols if col not in merged_df.columns]
-                    if missing_cols:
-                        continue
-
-                    mls_val = row.get(mls_col)
-                    mls_is_blank = pd.isna(mls_val) or (isinstance(mls_val, str) and mls_val.strip() == '')
-                    if mls_is_blank:
-                        continue
-
-                    cama_sum = 0
-                    all_cama_blank = True
-                    for col in cama_cols:
-                        val = row.get(col)
-                        if pd.notna(val):
-                            all_cama_blank = False
-                            try:
-                                cama_sum += pd.to_numeric(val, errors='coerce')
-                            except:
-                                pass
-
-                    if all_cama_blank:
-                        continue
-
-                    fields_compared.append(mls_col)
-
-                    if SKIP_ZERO_VALUES:
-                        try:
-                            mls_numeric = pd.to_numeric(mls_val, errors='coerce')
-                            # Only skip if BOTH values are zero (both agree there's no below-grade area)
-                            # If one is zero and the other is not, that's a mismatch!
-                            if (pd.notna(mls_numeric) and mls_numeric == 0) and (cama_sum == 0):
-                                continue
-                        except:
-                            pass
-
-                    if not values_equal(mls_val, cama_sum):
-                        record_mismatches.append({
-                            'Parcel_ID': record_id,
-                            'NOPAR': nopar,
-                            'ADDITIONAL_PARCELS': additional_parcels,
-                            'Listing_Number': listing_num,
-                            'SALEKEY': salekey,
-                            'Address': address,
-                            'City': city,
-                            'State': state,
-                            'Zip': zip_code,
-                            'Field_MLS': mls_col,
-                            'Field_CAMA': f"SUM({', '.join(cama_cols)})",
-                            'MLS_Value': mls_val,
-                            'CAMA_Value': cama_sum,
-                            'Difference': calculate_difference(mls_val, cama_sum),
-                            'Parcel_URL': parcel_url_template.format(parcel_id=record_id) if parcel_url_template else '',
-                            'Zillow_URL': format_zillow_url(address, city, state, zip_code)
-                        })
-
-            # Categorical comparisons
-            if cols_to_compare_categorical:
-                for mapping in cols_to_compare_categorical:
-                    mls_col = mapping['mls_col']
-                    cama_col = mapping['cama_col']
-
-                    if mls_col not in merged_df.columns or cama_col not in merged_df.columns:
-                        continue
-
-                    mls_val = row.get(mls_col)
-                    cama_val = row.get(cama_col)
-
-                    mls_is_blank = pd.isna(mls_val) or (isinstance(mls_val, str) and mls_val.strip() == '')
-                    cama_is_blank = pd.isna(cama_val) or (isinstance(cama_val, str) and cama_val.strip() == '')
-
-                    if mls_is_blank or cama_is_blank:
-                        continue
-
-                    fields_compared.append(mls_col)
-                    is_match = categorical_match(mls_val, cama_val, mapping)
-
-                    check_text = mapping.get('mls_check_contains', '')
-                    case_sensitive = mapping.get('case_sensitive', False)
-                    mls_str = str(mls_val).strip() if pd.notna(mls_val) else ''
-                    if not case_sensitive:
-                        mls_str = mls_str.lower()
-                        check_text_lower = check_text.lower()
-                    else:
-                        check_text_lower = check_text
-                    text_found = check_text_lower in mls_str
-                    expected_cama = mapping.get('cama_expected_if_true') if text_found else mapping.get('cama_expected_if_false')
-
-                    if not is_match:
-                        record_mismatches.append({
-                            'Parcel_ID': record_id,
-                            'NOPAR': nopar,
-                            'ADDITIONAL_PARCELS': additional_parcels,
-                            'Listing_Number': listing_num,
-                            'SALEKEY': salekey,
-                            'Address': address,
-                            'City': city,
-                            'State': state,
-                            'Zip': zip_code,
-                            'Field_MLS': mls_col,
-                            'Field_CAMA': cama_col,
-                            'MLS_Value': mls_val,
-                            'CAMA_Value': cama_val,
-                            'Expected_CAMA_Value': expected_cama,
-                            'Match_Rule': f"If '{check_text}' in {mls_col}, then {cama_col} should be {mapping.get('cama_expected_if_true')}, else {mapping.get('cama_expected_if_false')}",
-                            'Parcel_URL': parcel_url_template.format(parcel_id=record_id) if parcel_url_template else '',
-                            'Zillow_URL': format_zillow_url(address, city, state, zip_code)
-                        })
-
-            # Perfect matches
-            if not record_mismatches and fields_compared:
-                perfect_matches.append({
-                    'Parcel_ID': record_id,
-                    'NOPAR': nopar,
-                    'ADDITIONAL_PARCELS': additional_parcels,
-                    'Listing_Number': listing_num,
-                    'SALEKEY': salekey,
-                    'Address': address,
-                    'City': city,
-                    'State': state,
-                    'Zip': zip_code,
-                    'Fields_Compared': len(fields_compared),
-                    'Fields_List': ', '.join(fields_compared),
-                    'Parcel_URL': parcel_url_template.format(parcel_id=record_id) if parcel_url_template else '',
-                    'Zillow_URL': format_zillow_url(address, city, state, zip_code)
-                })
-
-            value_mismatches.extend(record_mismatches)
-
-    return (pd.DataFrame(missing_in_cama), pd.DataFrame(missing_in_mls), 
-            pd.DataFrame(value_mismatches), matched_df, pd.DataFrame(perfect_matches))
+    parcel_links = build_parcel_links(merged_df, cama_id_col_name, parcel_url_template)
+
+    missing_cama_rows = df_mls_renamed[~mls_in_cama & mls_id_values.notna()]
+    missing_in_cama = pd.DataFrame({
+        'Parcel_ID': missing_cama_rows[cama_id_col_name],
+        'Listing_Number': missing_cama_rows.get('Listing #', ''),
+        'Closed_Date': missing_cama_rows.get('Closed Date', '')
+    }).reset_index(drop=True)
+
+    missing_mls_rows = df_cama[~cama_in_mls & cama_id_values.notna()]
+    missing_in_mls = pd.DataFrame({'Parcel_ID': missing_mls_rows[cama_id_col_name]}).reset_index(drop=True)
+
+    # Convert every compared column to numbers once; nullable results (e.g. from
+    # Arrow-backed strings) are cast to float so missing values are plain NaN
+    numeric_cols = {}
+    for mapping in cols_to_compare_mapping + (cols_to_compare_sum or []) + (cols_to_compare_categorical or []):
+        for col in [mapping['mls_col'], mapping.get('cama_col'), *mapping.get('cama_cols', [])]:
+            if col in merged_df.columns and col not in numeric_cols:
+                numeric_cols[col] = pd.to_numeric(merged_df[col], errors='coerce').astype(float)
+
+    mismatch_frames = []
+    compared_masks = []
+    compared_fields = []
+
+    # Standard comparisons
+    for mapping in cols_to_compare_mapping:
+        mls_col = mapping['mls_col']
+        cama_col = mapping['cama_col']
+
+        if mls_col not in merged_df.columns or cama_col not in merged_df.columns:
+            continue
+
+        mls_vals = merged_df[mls_col]
+        cama_vals = merged_df[cama_col]
+        compared = ~(is_blank(mls_vals) | is_blank(cama_vals))
+
+        mls_numeric = numeric_cols[mls_col]
+        cama_numeric = numeric_cols[cama_col]
+        both_numeric = mls_numeric.notna() & cama_numeric.notna()
+
+        # Numbers are compared within tolerance; anything else as case-insensitive text
+        is_equal = pd.Series(np.where(
+            both_numeric,
+            np.isclose(mls_numeric, cama_numeric, equal_nan=False, rtol=1e-9, atol=NUMERIC_TOLERANCE),
+            normalize_text(mls_vals) == normalize_text(cama_vals)
+        ), index=merged_df.index)
+
+        if SKIP_ZERO_VALUES:
+            # Only skip if BOTH values are zero (both agree there's nothing)
+            # If one is zero and the other is not, that's a mismatch!
+            is_equal |= (mls_numeric == 0) & (cama_numeric == 0)
+
+        compared_masks.append(compared)
+        compared_fields.append(mls_col)
+
+        mismatch = compared & ~is_equal
+        mismatch_frames.append(pd.DataFrame({
+            'Field_MLS': mls_col,
+            'Field_CAMA': cama_col,
+            'MLS_Value': mls_vals[mismatch],
+            'CAMA_Value': cama_vals[mismatch],
+            'Difference': format_difference(mls_numeric[mismatch], cama_numeric[mismatch])
+        }, index=merged_df.index[mismatch]))
+
+    report_progress(0.5, "Compared standard fields")
+
+    # Sum comparisons
+    if cols_to_compare_sum:
+        for mapping in cols_to_compare_sum:
+            mls_col = mapping['mls_col']
+            cama_cols = mapping['cama_cols']
+
+            if mls_col not in merged_df.columns:
+                continue
+
+            missing_cols = [col for col in cama_cols if col not in merged_df.columns]
+            if missing_cols:
+                continue
+
+            mls_vals = merged_df[mls_col]
+            # min_count=1 leaves the sum blank when every CAMA value is blank; a non-blank value that
+            # isn't a number also blanks the sum, so the parcel is reported as a mismatch
+            cama_numeric = pd.concat([numeric_cols[col] for col in cama_cols], axis=1)
+            cama_sum = cama_numeric.sum(axis=1, min_count=1)
+            cama_sum = cama_sum.mask((merged_df[cama_cols].notna().to_numpy() & cama_numeric.isna().to_numpy()).any(axis=1))
+            compared = ~is_blank(mls_vals) & merged_df[cama_cols].notna().any(axis=1)
+
+            is_equal = pd.Series(
+                np.isclose(numeric_cols[mls_col], cama_sum, equal_nan=False, rtol=1e-9, atol=NUMERIC_TOLERANCE),
+                index=merged_df.index
+            )
+
+            if SKIP_ZERO_VALUES:
+                # Only skip if BOTH values are zero (both agree there's no below-grade area)
+                # If one is zero and the other is not, that's a mismatch!
+                is_equal |= (numeric_cols[mls_col] == 0) & (cama_sum == 0)
+
+            compared_masks.append(compared)
+            compared_fields.append(mls_col)
+
+            mismatch = compared & ~is_equal
+            mismatch_frames.append(pd.DataFrame({
+                'Field_MLS': mls_col,
+                'Field_CAMA': f"SUM({', '.join(cama_cols)})",
+                'MLS_Value': mls_vals[mismatch],
+                'CAMA_Value': cama_sum[mismatch],
+                'Difference': format_difference(numeric_cols[mls_col][mismatch], cama_sum[mismatch])
+            }, index=merged_df.index[mismatch]))
+
+    report_progress(0.6, "Compared summed fields")
+
+    # Categorical comparisons
+    if cols_to_compare_categorical:
+        for mapping in cols_to_compare_categorical:
+            mls_col = mapping['mls_col']
+            cama_col = mapping['cama_col']
+
+            if mls_col not in merged_df.columns or cama_col not in merged_df.columns:
+                continue
+
+            mls_vals = merged_df[mls_col]
+            cama_vals = merged_df[cama_col]
+            compared = ~(is_blank(mls_vals) | is_blank(cama_vals))
+
+            check_text = mapping.get('mls_check_contains', '')
+            case_sensitive = mapping.get('case_sensitive', False)
+            text_found = contains_text(mls_vals, check_text, case_sensitive)
+            expected_cama = pd.Series(np.where(
+                text_found,
+                mapping.get('cama_expected_if_true'),
+                mapping.get('cama_expected_if_false')
+            ), index=merged_df.index)
+
+            is_equal = pd.Series(np.isclose(
+                numeric_cols[cama_col],
+                pd.to_numeric(expected_cama, errors='coerce'),
+                equal_nan=True, rtol=1e-9, atol=NUMERIC_TOLERANCE
+            ), index=merged_df.index)
+
+            compared_masks.append(compared)
+            compared_fields.append(mls_col)
+
+            mismatch = compared & ~is_equal
+            mismatch_frames.append(pd.DataFrame({
+                'Field_MLS': mls_col,
+                'Field_CAMA': cama_col,
+                'MLS_Value': mls_vals[mismatch],
+                'CAMA_Value': cama_vals[mismatch],
+                'Expected_CAMA_Value': expected_cama[mismatch],
+                'Match_Rule': f"If '{check_text}' in {mls_col}, then {cama_col} should be {mapping.get('cama_expected_if_true')}, else {mapping.get('cama_expected_if_false')}"
+            }, index=merged_df.index[mismatch]))
+
+    report_progress(0.7, "Compared categorical fields")
+
+    # Keep each parcel's mismatches together, in field order
+    mismatched_rows = pd.Index([])
+    for frame in mismatch_frames:
+        mismatched_rows = mismatched_rows.union(frame.index)
+
+    # Field details are collected per field; the parcel columns are built once for all of them
+    mismatch_frames = [frame for frame in mismatch_frames if not frame.empty]
+    if mismatch_frames:
+        mismatch_fields = pd.concat(mismatch_frames).sort_index(kind='stable')
+        value_mismatches = build_records(
+            merged_df.loc[mismatch_fields.index].reset_index(drop=True),
+            cama_id_col_name, parcel_links,
+            dict(mismatch_fields.reset_index(drop=True).items())
+        )
+    else:
+        value_mismatches = pd.DataFrame()
+
+    # Perfect matches
+    if compared_masks:
+        compared_df = pd.concat(compared_masks, axis=1, keys=range(len(compared_masks)))
+        perfect = compared_df.any(axis=1) & ~merged_df.index.isin(mismatched_rows)
+        perfect_compared = compared_df.loc[perfect]
+        fields_list = perfect_compared.dot(pd.Series([f"{field}, " for field in compared_fields])).astype(str)
+        perfect_matches = build_records(merged_df.loc[perfect], cama_id_col_name, parcel_links, {
+            'Fields_Compared': perfect_compared.sum(axis=1),
+            'Fields_List': fields_list.str[:-2]
+        }).reset_index(drop=True)
+    else:
+        perfect_matches = pd.DataFrame()
+
+    report_progress(1.0, "Built mismatch and perfect match records")
+
+    return missing_in_cama, missing_in_mls, value_mismatches, merged_df, perfect_matches
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4)
+def run_comparison(mls_hash, cama_hash, tolerance, skip_zeros, window_id, _df_mls, _df_cama,
+                   _progress_callback=None):
+    """Run the comparison, cached on the uploaded files' hashes and the comparison settings.
+
+    tolerance and skip_zeros are read by compare_data_enhanced through NUMERIC_TOLERANCE and
+    SKIP_ZERO_VALUES; they are parameters here so that changing them invalidates the cache.
+    """
+    missing_in_cama, missing_in_mls, value_mismatches, merged_df, perfect_matches = compare_data_enhanced(
+        _df_mls, _df_cama,
+        UNIQUE_ID_COLUMN,
+        COLUMNS_TO_COMPARE,
+        cols_to_compare_sum=COLUMNS_TO_COMPARE_SUM,
+        cols_to_compare_categorical=COLUMNS_TO_COMPARE_CATEGORICAL,
+        window_id=window_id,
+        progress_callback=_progress_callback
+    )
+
+    # Arrow-backed result frames can be handed to st.dataframe without converting them on every rerun;
+    # mixed-type value columns stay as objects
+    missing_in_cama, missing_in_mls, value_mismatches, perfect_matches = (
+        df.convert_dtypes(dtype_backend='pyarrow')
+        for df in (missing_in_cama, missing_in_mls, value_mismatches, perfect_matches)
+    )
+    return missing_in_cama, missing_in_mls, value_mismatches, merged_df, perfect_matches
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4)
+def city_match_statistics(mls_hash, cama_hash, cama_city_col, _df_cama, _matched_df):
+    """Count total and matched CAMA parcels per city, cached per pair of uploaded files."""
+    cama_id_col = UNIQUE_ID_COLUMN['cama_col']
+
+    # Count total and matched CAMA parcels by city in a single groupby
+    is_matched = _df_cama[cama_id_col].isin(_matched_df[cama_id_col])
+    city_comparison = (
+        _df_cama.assign(_matched=is_matched.astype('int8'))
+        .groupby(cama_city_col, observed=True)
+        .agg(Total_CAMA_Parcels=(cama_id_col, 'count'), Matched_Parcels=('_matched', 'sum'))
+        .rename_axis('City')
+        .reset_index()
+    )
+    city_comparison['Matched_Parcels'] = city_comparison['Matched_Parcels'].astype(int)
+    city_comparison['Match_Rate'] = (city_comparison['Matched_Parcels'] / city_comparison['Total_CAMA_Parcels'] * 100).round(2)
+    city_comparison['Not_Matched'] = city_comparison['Total_CAMA_Parcels'] - city_comparison['Matched_Parcels']
+
+    # Sort by total parcels descending
+    return city_comparison.sort_values('Total_CAMA_Parcels', ascending=False)
+
+def hyperlink_urls(df):
+    """Flag the non-blank URLs that become hyperlinks, one column per linked report column."""
+    return pd.DataFrame({
+        link_col: ~is_blank(df[url_col])
+        for link_col, url_col in HYPERLINK_COLUMNS.items()
+        if link_col in df.columns and url_col in df.columns
+    }, index=df.index)
+
+def write_excel_with_hyperlinks(df, sheet_name, output):
+    """Write an Excel report with hyperlinks to a binary file object."""
+    # URL columns are only used to create hyperlinks, so they are not written out
+    report_df = df.drop(columns=[url_col for url_col in HYPERLINK_COLUMNS.values() if url_col in df.columns])
+    # Blank URLs are dropped up front so only real links are written
+    has_url = hyperlink_urls(df)
+    link_urls = {
+        report_df.columns.get_loc(link_col): df[HYPERLINK_COLUMNS[link_col]].astype(object).where(has_url[link_col], None).tolist()
+        for link_col in has_url.columns
+    }
+    links_written = 0
+
+    # constant_memory flushes each row as soon as the next one starts, so rows must be written in order.
+    # Links are written explicitly below, so plain strings are not scanned for URLs
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    ws = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    ws.write_row(0, 0, [str(col) for col in report_df.columns], header_format)
+
+    # Missing values become None so they are left as empty cells
+    report_rows = report_df.astype(object).where(report_df.notna(), None)
+    for row_idx, row in enumerate(report_rows.itertuples(index=False, name=None), start=1):
+        ws.write_row(row_idx, 0, row)
+
+        # Add Parcel_ID hyperlinks to iasWorld and Address hyperlinks to Zillow
+        for col_idx, urls in link_urls.items():
+            url = urls[row_idx - 1]
+            if url is not None and links_written < EXCEL_MAX_HYPERLINKS:
+                ws.write_url(row_idx, col_idx, url, string=str(row[col_idx]))
+                links_written += 1
+
+    workbook.close()
+
+    skipped_links = int(has_url.to_numpy().sum()) - links_written
+    if skipped_links:
+        warnings.warn(f"'{sheet_name}' has more than {EXCEL_MAX_HYPERLINKS:,} hyperlinks; "
+                      f"the last {skipped_links:,} were written as plain text")
 
 def create_excel_with_hyperlinks(df, sheet_name='Sheet1'):
     """Create Excel file with hyperlinks in memory."""
     output = io.BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    
-    output.seek(0)
-    wb = load_workbook(output)
-    ws = wb[sheet_name]
-    
-    # Add Parcel_ID hyperlinks
-    if 'Parcel_ID' in df.columns and 'Parcel_URL' in df.columns:
-        parcel_col_idx = list(df.columns).index('Parcel_ID') + 1
-        url_col_idx = list(df.columns).index('Parcel_URL') + 1
-        
-        for row_idx in range(2, len(df) + 2):
-            cell = ws.cell(row=row_idx, column=parcel_col_idx)
-            url = ws.cell(row=row_idx, column=url_col_idx).value
-            if url and str(url).strip() and str(url) != 'nan':
-                cell.hyperlink = url
-                cell.style = 'Hyperlink'
-    
-    # Add Address hyperlinks to Zillow
-    if 'Address' in df.columns and 'Zillow_URL' in df.columns:
-        address_col_idx = list(df.columns).index('Address') + 1
-        zillow_col_idx = list(df.columns).index('Zillow_URL') + 1
-        
-        for row_idx in range(2, len(df) + 2):
-            cell = ws.cell(row=row_idx, column=address_col_idx)
-            url = ws.cell(row=row_idx, column=zillow_col_idx).value
-            if url and str(url).strip() and str(url) != 'nan':
-                cell.hyperlink = url
-                cell.style = 'Hyperlink'
-    
-    # Remove URL columns (they were just for creating hyperlinks)
-    if 'Parcel_URL' in df.columns:
-        url_col_idx = list(df.columns).index('Parcel_URL') + 1
-        ws.delete_cols(url_col_idx)
-    
-    if 'Zillow_URL' in df.columns:
-        # Recalculate index after potential deletion
-        remaining_cols = [col for col in df.columns if col not in ['Parcel_URL']]
-        if 'Zillow_URL' in remaining_cols:
-            zillow_col_idx = remaining_cols.index('Zillow_URL') + 1
-            ws.delete_cols(zillow_col_idx)
-    
-    final_output = io.BytesIO()
-    wb.save(final_output)
-    final_output.seek(0)
-    
-    return final_output.getvalue()
+    write_excel_with_hyperlinks(df, sheet_name, output)
+    return output.getvalue()
 
 def create_zip_with_all_reports(df_missing_cama, df_missing_mls, df_value_mismatches, 
-                                 df_perfect_matches, city_comparison_df=None):
+                                 df_perfect_matches, city_comparison_df=None, timestamp=None):
     """Create a ZIP file containing all Excel reports and stats CSV with timestamped filenames."""
-    import zipfile
-    
-    # Get current timestamp for filenames (date only)
-    timestamp = datetime.now().strftime("%Y-%m-%d")
+    # Default to the current date for filenames
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d")
     
     # Create ZIP file in memory
     zip_buffer = io.BytesIO()
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Add each Excel report if it has data
-        if not df_missing_cama.empty:
-            excel_data = create_excel_with_hyperlinks(df_missing_cama, 'Missing in CAMA')
-            filename = f"missing_in_CAMA_{timestamp}.xlsx"
-            zip_file.writestr(filename, excel_data)
-        
-        if not df_missing_mls.empty:
-            excel_data = create_excel_with_hyperlinks(df_missing_mls, 'Missing in MLS')
-            filename = f"missing_in_MLS_{timestamp}.xlsx"
-            zip_file.writestr(filename, excel_data)
-        
-        if not df_value_mismatches.empty:
-            excel_data = create_excel_with_hyperlinks(df_value_mismatches, 'Value Mismatches')
-            filename = f"value_mismatches_{timestamp}.xlsx"
-            zip_file.writestr(filename, excel_data)
-        
-        if not df_perfect_matches.empty:
-            excel_data = create_excel_with_hyperlinks(df_perfect_matches, 'Perfect Matches')
-            filename = f"perfect_matches_{timestamp}.xlsx"
-            zip_file.writestr(filename, excel_data)
+    reports = [
+        (df_missing_cama, 'Missing in CAMA'),
+        (df_missing_mls, 'Missing in MLS'),
+        (df_value_mismatches, 'Value Mismatches'),
+        (df_perfect_matches, 'Perfect Matches'),
+    ]
+    
+    # Only the small CSV is deflated, so use the fastest compression level
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_file:
+        # Write each Excel report that has data straight into its ZIP entry, so only one
+        # workbook is in progress at a time; XLSX files are already compressed, so store them as-is
+        for df, sheet_name in reports:
+            if df.empty:
+                continue
+            entry = zipfile.ZipInfo(f"{REPORT_FILE_PREFIXES[sheet_name]}_{timestamp}.xlsx", date_time=datetime.now().timetuple()[:6])
+            entry.compress_type = zipfile.ZIP_STORED
+            with zip_file.open(entry, 'w') as entry_file:
+                write_excel_with_hyperlinks(df, sheet_name, entry_file)
         
         # Add city statistics CSV if available
         if city_comparison_df is not None and not city_comparison_df.empty:
@@ -484,6 +590,30 @@ def create_zip_with_all_reports(df_missing_cama, df_missing_mls, df_value_mismat
     zip_buffer.seek(0)
     return zip_buffer.getvalue()
 
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=16)
+def cached_excel_report(comparison_key, sheet_name, _df):
+    """Build one report's Excel file, cached on the comparison that produced it instead of hashing the frame."""
+    return create_excel_with_hyperlinks(_df, sheet_name)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4)
+def cached_zip_report(comparison_key, timestamp, _df_missing_cama, _df_missing_mls, _df_value_mismatches,
+                      _df_perfect_matches, _city_comparison_df=None):
+    """Build the all-reports ZIP, cached on the comparison that produced it instead of hashing the frames."""
+    return create_zip_with_all_reports(_df_missing_cama, _df_missing_mls, _df_value_mismatches,
+                                       _df_perfect_matches, _city_comparison_df, timestamp)
+
+@st.fragment
+def individual_report_download(comparison_key, reports, timestamp):
+    """Let the user pick one report to download; changing the pick only reruns this fragment."""
+    sheet_name = st.selectbox("Report", list(reports))
+    df = reports[sheet_name]
+    st.download_button(
+        label=f"📄 Download {sheet_name}",
+        data=lambda: cached_excel_report(comparison_key, sheet_name, df),
+        file_name=f"{REPORT_FILE_PREFIXES[sheet_name]}_{timestamp}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
 # --- Streamlit App ---
 
 st.title("📊 MLS vs CAMA Data Comparison Tool")
@@ -548,13 +678,35 @@ with col2:
         help="Upload your CAMA Excel file"
     )
 
+# Only the columns used by the comparison are read from the uploads. IDs are read
+# as text so both files match on the same type, and low-cardinality text columns are
+# categorical. Compared columns are left as read; the comparison converts them to numbers.
+MLS_USECOLS, CAMA_USECOLS = referenced_columns(
+    UNIQUE_ID_COLUMN,
+    COLUMNS_TO_COMPARE,
+    cols_to_compare_sum=COLUMNS_TO_COMPARE_SUM,
+    cols_to_compare_categorical=COLUMNS_TO_COMPARE_CATEGORICAL
+)
+MLS_DTYPES = {
+    UNIQUE_ID_COLUMN['mls_col']: str,
+    **{col: 'category' for col in CATEGORICAL_COLUMNS}
+}
+CAMA_DTYPES = {
+    UNIQUE_ID_COLUMN['cama_col']: str,
+    **{col: 'category' for col in CATEGORICAL_COLUMNS}
+}
+
 # Process data when both files are uploaded
 if mls_file and cama_file:
     
     with st.spinner("Loading data files..."):
         try:
-            df_mls = pd.read_excel(mls_file)
-            df_cama = pd.read_excel(cama_file)
+            mls_bytes = mls_file.getvalue()
+            cama_bytes = cama_file.getvalue()
+            df_mls = load_excel(mls_bytes, MLS_USECOLS, MLS_DTYPES)
+            df_cama = load_excel(cama_bytes, CAMA_USECOLS, CAMA_DTYPES)
+            mls_hash = hashlib.md5(mls_bytes).hexdigest()
+            cama_hash = hashlib.md5(cama_bytes).hexdigest()
             st.success("✅ Data files loaded successfully!")
         except Exception as e:
             st.error(f"Error loading files: {e}")
@@ -574,17 +726,43 @@ if mls_file and cama_file:
     # Run comparison button
     if st.button("🔍 Run Comparison", type="primary", use_container_width=True):
         
-        with st.spinner("Comparing data... This may take a moment."):
-            df_missing_cama, df_missing_mls, df_value_mismatches, matched_df, df_perfect_matches = \
-                compare_data_enhanced(
-                    df_mls, df_cama, 
-                    UNIQUE_ID_COLUMN,
-                    COLUMNS_TO_COMPARE,
-                    cols_to_compare_sum=COLUMNS_TO_COMPARE_SUM,
-                    cols_to_compare_categorical=COLUMNS_TO_COMPARE_CATEGORICAL,
-                    window_id=window_id
+        # Identifies this comparison's results, so caches keyed on it never need to hash the frames
+        comparison_key = (mls_hash, cama_hash, NUMERIC_TOLERANCE, SKIP_ZERO_VALUES, window_id)
+
+        with st.status("Comparing data... This may take a moment.") as status:
+            progress_bar = st.progress(0.0)
+            comparison_progress = {'fraction_done': 0.0, 'message': "Matching records"}
+
+            # Run the comparison in a worker thread (sharing this session's script context,
+            # so any errors it reports still render) and update the progress bar while it runs
+            with ThreadPoolExecutor(max_workers=1, initializer=add_script_run_ctx,
+                                    initargs=(None, get_script_run_ctx())) as executor:
+                future = executor.submit(
+                    run_comparison,
+                    *comparison_key,
+                    df_mls, df_cama,
+                    _progress_callback=lambda fraction_done, message: comparison_progress.update(
+                        fraction_done=fraction_done, message=message
+                    )
                 )
+                while not future.done():
+                    progress_bar.progress(comparison_progress['fraction_done'], text=comparison_progress['message'])
+                    time.sleep(0.1)
+
+                df_missing_cama, df_missing_mls, df_value_mismatches, matched_df, df_perfect_matches = \
+                    future.result()
+
+            progress_bar.progress(1.0, text="Done")
+            status.update(label="✅ Comparison complete", state="complete", expanded=False)
         
+        # Date stamp shared by every downloaded file name (date only)
+        timestamp = datetime.now().strftime("%Y-%m-%d")
+
+        # Which reports have rows, checked once for the summary, previews and downloads
+        has_missing_cama, has_missing_mls, has_mismatches, has_matches = (
+            not df.empty for df in (df_missing_cama, df_missing_mls, df_value_mismatches, df_perfect_matches)
+        )
+
         # Display results
         st.header("📈 Results Summary")
         
@@ -602,7 +780,7 @@ if mls_file and cama_file:
         with col1:
             st.metric("✅ Perfect Matches", len(df_perfect_matches))
         with col2:
-            if not df_value_mismatches.empty:
+            if has_mismatches:
                 unique_fields = df_value_mismatches['Field_MLS'].nunique()
                 st.metric("📊 Fields with Mismatches", unique_fields)
         
@@ -627,6 +805,7 @@ if mls_file and cama_file:
         st.subheader("Match Rate by City")
         
         # Determine which city column to use - prefer CAMA's city column
+        city_comparison = None
         cama_city_col = None
         if 'CITYNAME' in df_cama.columns:
             cama_city_col = 'CITYNAME'
@@ -639,25 +818,7 @@ if mls_file and cama_file:
             
             # Check if the city column exists in matched_df (it should since it came from CAMA)
             if cama_city_col in matched_df.columns:
-                # Get total CAMA parcels by city
-                cama_cities = df_cama.groupby(cama_city_col)[cama_id_col].count().reset_index()
-                cama_cities.columns = ['City', 'Total_CAMA_Parcels']
-                
-                # Get matched parcels by city (use the same city column)
-                matched_cities = matched_df.groupby(cama_city_col)[cama_id_col].count().reset_index()
-                matched_cities.columns = ['City', 'Matched_Parcels']
-                
-                # Merge the two dataframes
-                city_comparison = pd.merge(cama_cities, matched_cities, on='City', how='left')
-                city_comparison['Matched_Parcels'] = city_comparison['Matched_Parcels'].fillna(0).astype(int)
-                city_comparison['Match_Rate'] = (city_comparison['Matched_Parcels'] / city_comparison['Total_CAMA_Parcels'] * 100).round(2)
-                city_comparison['Not_Matched'] = city_comparison['Total_CAMA_Parcels'] - city_comparison['Matched_Parcels']
-                
-                # Sort by total parcels descending
-                city_comparison = city_comparison.sort_values('Total_CAMA_Parcels', ascending=False)
-                
-                # Store in session state for download all button
-                st.session_state['city_comparison'] = city_comparison
+                city_comparison = city_match_statistics(mls_hash, cama_hash, cama_city_col, df_cama, matched_df)
                 
                 # Display as a formatted table
                 st.dataframe(
@@ -668,12 +829,12 @@ if mls_file and cama_file:
                 
                 # Download button for city statistics
                 csv = city_comparison.to_csv(index=False)
-                timestamp_csv = datetime.now().strftime("%Y-%m-%d")
                 st.download_button(
                     label="📥 Download City Statistics (CSV)",
                     data=csv,
-                    file_name=f"city_match_statistics_{timestamp_csv}.csv",
-                    mime="text/csv"
+                    file_name=f"city_match_statistics_{timestamp}.csv",
+                    mime="text/csv",
+                    on_click="ignore"
                 )
                 
                 # Visualizations
@@ -703,7 +864,7 @@ if mls_file and cama_file:
             st.info("ℹ️ City information not available in the data")
         
         # Mismatch breakdown
-        if not df_value_mismatches.empty:
+        if has_mismatches:
             st.subheader("📊 Mismatches by Field")
             mismatch_counts = df_value_mismatches['Field_MLS'].value_counts()
             st.bar_chart(mismatch_counts)
@@ -718,106 +879,81 @@ if mls_file and cama_file:
             "Perfect Matches"
         ])
         
-        with tab1:
-            if not df_missing_cama.empty:
-                st.dataframe(df_missing_cama, use_container_width=True)
-            else:
-                st.info("No records missing in CAMA")
-        
-        with tab2:
-            if not df_missing_mls.empty:
-                st.dataframe(df_missing_mls, use_container_width=True)
-            else:
-                st.info("No records missing in MLS")
-        
-        with tab3:
-            if not df_value_mismatches.empty:
-                st.dataframe(df_value_mismatches, use_container_width=True)
-            else:
-                st.info("No value mismatches found")
-        
-        with tab4:
-            if not df_perfect_matches.empty:
-                st.dataframe(df_perfect_matches, use_container_width=True)
+        # Only the first rows are sent to the browser; the downloads below have the full reports
+        preview_column_config = {
+            url_col: st.column_config.LinkColumn(url_col) for url_col in HYPERLINK_COLUMNS.values()
+        }
+        for tab, df, has_rows, empty_message in [
+            (tab1, df_missing_cama, has_missing_cama, "No records missing in CAMA"),
+            (tab2, df_missing_mls, has_missing_mls, "No records missing in MLS"),
+            (tab3, df_value_mismatches, has_mismatches, "No value mismatches found"),
+            (tab4, df_perfect_matches, has_matches, "No perfect matches found"),
+        ]:
+            with tab:
+                if has_rows:
+                    if len(df) > PREVIEW_ROWS:
+                        st.caption(f"Showing the first {PREVIEW_ROWS:,} of {len(df):,} rows. "
+                                   "Download the report for the full list.")
+                    st.dataframe(
+                        df.head(PREVIEW_ROWS),
+                        width="stretch",
+                        hide_index=True,
+                        column_config=preview_column_config
+                    )
+                else:
+                    st.info(empty_message)
+        
+        # Download section, collapsed until the user wants a file
+        with st.expander("📥 Download Reports", expanded=False):
+            # Download All button
+            st.markdown("### 📦 Download All Reports")
+        
+            zip_filename = f"MLS_CAMA_Comparison_All_Reports_{timestamp}.zip"
+        
+            # The ZIP file is only built when the button is clicked; clicking it must not rerun
+            # the script, which would clear the results shown above
+            st.download_button(
+                label="📦 Download All Reports (ZIP)",
+                data=lambda: cached_zip_report(
+                    comparison_key,
+                    timestamp,
+                    df_missing_cama,
+                    df_missing_mls,
+                    df_value_mismatches,
+                    df_perfect_matches,
+                    city_comparison
+                ),
+                file_name=zip_filename,
+                mime="application/zip",
+                help="Downloads all Excel reports and city statistics in a single ZIP file",
+                on_click="ignore",
+                use_container_width=True
+            )
+        
+            st.markdown("### 📄 Download Individual Reports")
+        
+            # Only reports that have rows can be picked
+            individual_reports = {
+                sheet_name: df
+                for sheet_name, df, has_rows in [
+                    ('Missing in CAMA', df_missing_cama, has_missing_cama),
+                    ('Missing in MLS', df_missing_mls, has_missing_mls),
+                    ('Value Mismatches', df_value_mismatches, has_mismatches),
+                    ('Perfect Matches', df_perfect_matches, has_matches),
+                ]
+                if has_rows
+            }
+            over_link_limit = [
+                sheet_name for sheet_name, df in individual_reports.items()
+                if hyperlink_urls(df).to_numpy().sum() > EXCEL_MAX_HYPERLINKS
+            ]
+            if over_link_limit:
+                st.caption(f"ℹ️ Excel allows {EXCEL_MAX_HYPERLINKS:,} hyperlinks per sheet, so later rows of "
+                           f"{', '.join(over_link_limit)} are not clickable.")
+            if individual_reports:
+                individual_report_download(comparison_key, individual_reports, timestamp)
             else:
-                st.info("No perfect matches found")
-        
-        # Download section
-        st.header("📥 Download Reports")
-        
-        # Download All button
-        st.markdown("### 📦 Download All Reports")
-        
-        # Get city comparison if available
-        city_comp = st.session_state.get('city_comparison', None)
-        
-        # Generate timestamp for the ZIP filename (date only)
-        timestamp = datetime.now().strftime("%Y-%m-%d")
-        zip_filename = f"MLS_CAMA_Comparison_All_Reports_{timestamp}.zip"
-        
-        # Create the ZIP file
-        zip_data = create_zip_with_all_reports(
-            df_missing_cama, 
-            df_missing_mls, 
-            df_value_mismatches, 
-            df_perfect_matches,
-            city_comp
-        )
-        
-        st.download_button(
-            label="📦 Download All Reports (ZIP)",
-            data=zip_data,
-            file_name=zip_filename,
-            mime="application/zip",
-            help="Downloads all Excel reports and city statistics in a single ZIP file",
-            use_container_width=True
-        )
-        
-        st.markdown("### 📄 Download Individual Reports")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if not df_missing_cama.empty:
-                excel_data = create_excel_with_hyperlinks(df_missing_cama, 'Missing in CAMA')
-                timestamp = datetime.now().strftime("%Y-%m-%d")
-                st.download_button(
-                    label="📄 Download Missing in CAMA",
-                    data=excel_data,
-                    file_name=f"missing_in_CAMA_{timestamp}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            
-            if not df_value_mismatches.empty:
-                excel_data = create_excel_with_hyperlinks(df_value_mismatches, 'Value Mismatches')
-                timestamp = datetime.now().strftime("%Y-%m-%d")
-                st.download_button(
-                    label="⚠️ Download Value Mismatches",
-                    data=excel_data,
-                    file_name=f"value_mismatches_{timestamp}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-        
-        with col2:
-            if not df_missing_mls.empty:
-                excel_data = create_excel_with_hyperlinks(df_missing_mls, 'Missing in MLS')
-                timestamp = datetime.now().strftime("%Y-%m-%d")
-                st.download_button(
-                    label="📄 Download Missing in MLS",
-                    data=excel_data,
-                    file_name=f"missing_in_MLS_{timestamp}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            
-            if not df_perfect_matches.empty:
-                excel_data = create_excel_with_hyperlinks(df_perfect_matches, 'Perfect Matches')
-                timestamp = datetime.now().strftime("%Y-%m-%d")
-                st.download_button(
-                    label="✅ Download Perfect Matches",
-                    data=excel_data,
-                    file_name=f"perfect_matches_{timestamp}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                st.info("No individual reports to download")
 
 else:
     st.info("👆 Please upload both MLS and CAMA data files to begin.")